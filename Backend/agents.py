@@ -1,36 +1,111 @@
 import os
+import functools
+import hashlib
 import json
+import logging
+import orjson
 import re
+import httpx
+import tiktoken
+from collections import OrderedDict
+from typing import Optional
+import fastjsonschema
 from openai import AsyncOpenAI
 from dotenv import load_dotenv
+from schemas import (
+    validate_ats_analyzer,
+    validate_ats_optimizer,
+    validate_interview_coach,
+    validate_interview_answers,
+)
 
 load_dotenv()
 
+logger = logging.getLogger("neuraresume")
+
 LLM_API_KEY = os.getenv("LLM_API_KEY")
 LLM_BASE_URL = os.getenv("LLM_BASE_URL")
 LLM_MODEL = os.getenv("LLM_MODEL", "llama-3.3-70b-versatile") # Default fallback
 
 
 if not LLM_API_KEY:
-    print("Warning: LLM_API_KEY not found in environment variables.")
+    logger.warning("LLM_API_KEY not found in environment variables.")
 
 # Initialize OpenAI client (works with Groq, Together, Ollama etc.)
+# A shared, pooled HTTP/2 client so concurrent agent calls reuse connections
+http_client = httpx.AsyncClient(
+    limits=httpx.Limits(max_connections=100, max_keepalive_connections=50),
+    http2=True,
+    timeout=httpx.Timeout(60, connect=10),
+)
+
 client = AsyncOpenAI(
     api_key=LLM_API_KEY,
-    base_url=LLM_BASE_URL
+    base_url=LLM_BASE_URL,
+    http_client=http_client,
+    max_retries=2
 )
 
+# Markdown code fence patterns, compiled once for clean_json_text
+_FENCE_OPEN = re.compile(r"^```(?:json)?\s*")
+_FENCE_CLOSE = re.compile(r"\s*```$")
+
 def clean_json_text(text: str) -> str:
     """Removes markdown code blocks and whitespace to extract JSON."""
     text = text.strip()
+    if not text.startswith("```"):
+        return text
     # Remove ```json ... ``` or just ``` ... ```
-    if text.startswith("```"):
-        text = re.sub(r"^```(?:json)?\s*", "", text)
-        text = re.sub(r"\s*```$", "", text)
+    text = _FENCE_OPEN.sub("", text)
+    text = _FENCE_CLOSE.sub("", text)
     return text.strip()
 
-async def generate_json(prompt: str) -> dict:
-    """Helper to generate JSON from LLM."""
+# Resume text compaction before it is embedded in prompts
+RESUME_MAX_TOKENS = 6000
+_INLINE_WHITESPACE = re.compile(r"[ \t\u00a0]+")
+_BLANK_LINES = re.compile(r"\n{3,}")
+# Only explicit page markers ("Page 2", "Page 2 of 3", "Page 2/3", "2 of 3"); bare numbers
+# are kept since years, scores and phone numbers often land on a line of their own
+_PAGE_NUMBER_LINE = re.compile(r"^(?:page\s*\d+(?:\s*(?:of|/)\s*\d+)?|\d+\s+of\s+\d+)$", re.IGNORECASE)
+
+# Rough size of a token, used to cap the text when the tokenizer is unavailable
+CHARS_PER_TOKEN = 4
+# Not the served model's own tokenizer, but close enough to bound prompt size. Set by
+# load_tokenizer() at app startup; None means the character-based cap is used instead.
+_TOKENIZER = None
+
+def load_tokenizer() -> None:
+    """Loads the tiktoken encoding used by compact_resume_text, if it can be fetched."""
+    global _TOKENIZER
+    try:
+        # tiktoken downloads the BPE file on first use unless TIKTOKEN_CACHE_DIR has it
+        _TOKENIZER = tiktoken.encoding_for_model("gpt-4o-mini")
+    except Exception as e:
+        logger.warning(
+            "Could not load tiktoken encoding, capping resume text at ~%d chars per token instead: %s",
+            CHARS_PER_TOKEN,
+            e,
+        )
+
+def compact_resume_text(text: str, max_tokens: int = RESUME_MAX_TOKENS) -> str:
+    """Collapses whitespace, drops page-number lines and caps the text at max_tokens."""
+    lines = []
+    for line in text.splitlines():
+        line = _INLINE_WHITESPACE.sub(" ", line).strip()
+        if _PAGE_NUMBER_LINE.match(line):
+            continue
+        lines.append(line)
+    text = _BLANK_LINES.sub("\n\n", "\n".join(lines)).strip()
+    if _TOKENIZER is None:
+        return text[:max_tokens * CHARS_PER_TOKEN]
+    # Resume text is user input: special-token strings like <|endoftext|> are plain text here
+    tokens = _TOKENIZER.encode(text, disallowed_special=())
+    if len(tokens) > max_tokens:
+        text = _TOKENIZER.decode(tokens[:max_tokens])
+    return text
+
+async def _complete_json(prompt: str) -> dict:
+    """Requests a single JSON completion from the LLM and parses it."""
     try:
         response = await client.chat.completions.create(
             model=LLM_MODEL,
@@ -40,147 +115,183 @@ async def generate_json(prompt: str) -> dict:
             ],
             temperature=0.7,
             max_tokens=4096,
+            # Not streamed: Groq's JSON mode does not support streaming, and both
+            # endpoints need the complete object before they can respond anyway
             response_format={"type": "json_object"} # Enforce JSON mode if supported
         )
         content = response.choices[0].message.content
+        # JSON mode normally returns a bare object, only clean up when that fails
+        try:
+            return orjson.loads(content)
+        except orjson.JSONDecodeError:
+            pass
         cleaned_text = clean_json_text(content)
-        return json.loads(cleaned_text)
+        try:
+            return orjson.loads(cleaned_text)
+        except orjson.JSONDecodeError:
+            # orjson is strict (e.g. rejects NaN), let the stdlib parser have a go
+            return json.loads(cleaned_text)
     except Exception as e:
-        print(f"Error generating JSON: {e}")
+        logger.error("Error generating JSON: %s", e)
         # Fallback: try to parse without strict json_object mode if it failed
         return None
 
-async def run_ats_analyzer(resume_text: str, job_description: str = None) -> dict:
-    prompt = f"""
+async def generate_json(prompt: str, validate=None) -> dict:
+    """Helper to generate JSON from LLM, retrying once if it fails schema validation."""
+    for attempt in range(2):
+        result = await _complete_json(prompt)
+        if result is None or validate is None:
+            return result
+        try:
+            validate(result)
+            return result
+        except fastjsonschema.JsonSchemaException as e:
+            logger.warning("LLM JSON failed validation (attempt %d): %s", attempt + 1, e.message)
+    return None
+
+# In-process LRU of agent results keyed by (agent, resume hash, JD hash)
+AGENT_CACHE_SIZE = 256
+_agent_cache: "OrderedDict[tuple, dict]" = OrderedDict()
+
+def _digest(text: Optional[str]) -> str:
+    return hashlib.sha256((text or "").encode()).hexdigest()
+
+def cached_agent(agent):
+    """Memoizes an agent's JSON result on the resume and job description."""
+    @functools.wraps(agent)
+    async def wrapper(resume_text: str, job_description: str = None) -> dict:
+        key = (agent.__name__, _digest(resume_text), _digest(job_description))
+        if key in _agent_cache:
+            _agent_cache.move_to_end(key)
+            return _agent_cache[key]
+        result = await agent(resume_text, job_description)
+        # Failed generations return None, don't pin those in the cache
+        if result is not None:
+            _agent_cache[key] = result
+            if len(_agent_cache) > AGENT_CACHE_SIZE:
+                _agent_cache.popitem(last=False)
+        return result
+    return wrapper
+
+# Shared prompt prefix. Every agent sends the same system message followed by this
+# byte-identical resume/JD block, so providers with prefix caching can reuse it
+# across the concurrent agent calls for one request.
+_PROMPT_PREFIX = """Resume Text:
+{resume}
+
+Job Description:
+{jd}
+
+---
+"""
+
+def _prompt_prefix(resume_text: str, job_description: str = None) -> str:
+    return _PROMPT_PREFIX.format_map({
+        "resume": resume_text,
+        "jd": job_description or "Not provided.",
+    })
+
+# Agent-specific instructions, appended after the shared prefix
+_ATS_ANALYZER_TAIL = """
     You are an ATS_ANALYZER_AGENT.
     Goal: Parse the resume and estimate an ATS score.
-    
-    Resume Text:
-    {resume_text}
-    
-    Job Description:
-    {job_description if job_description else "Not provided. Infer role from resume."}
+    If no job description is provided, infer the target role from the resume.
     
     Output must be a JSON object with the exact structure:
-    {{
-      "parsedResume": {{
+    {
+      "parsedResume": {
         "name": "<string>",
-        "contact": {{ "email": "...", "phone": "...", "location": "...", "linkedin": "...", "portfolio": "..." }},
+        "contact": { "email": "...", "phone": "...", "location": "...", "linkedin": "...", "portfolio": "..." },
         "summary": "...",
-        "skills": [ {{ "name": "...", "category": "...", "proficiencyLevel": "..." }} ],
-        "experience": [ {{ "title": "...", "company": "...", "startDate": "...", "endDate": "...", "descriptionBullets": ["..."] }} ],
-        "projects": [ {{ "name": "...", "role": "...", "descriptionBullets": ["..."], "technologies": ["..."] }} ],
-        "education": [ {{ "degree": "...", "institution": "...", "startYear": "...", "endYear": "..." }} ],
-        "certifications": [ {{ "name": "...", "issuer": "...", "year": "..." }} ],
+        "skills": [ { "name": "...", "category": "...", "proficiencyLevel": "..." } ],
+        "experience": [ { "title": "...", "company": "...", "startDate": "...", "endDate": "...", "descriptionBullets": ["..."] } ],
+        "projects": [ { "name": "...", "role": "...", "descriptionBullets": ["..."], "technologies": ["..."] } ],
+        "education": [ { "degree": "...", "institution": "...", "startYear": "...", "endYear": "..." } ],
+        "certifications": [ { "name": "...", "issuer": "...", "year": "..." } ],
         "extraSections": []
-      }},
-      "atsScore": {{
+      },
+      "atsScore": {
         "score": <0-100>,
-        "scoreBreakdown": {{ "keywordMatch": <0-100>, "sectionStructure": <0-100>, "readability": <0-100>, "roleAlignment": <0-100> }},
+        "scoreBreakdown": { "keywordMatch": <0-100>, "sectionStructure": <0-100>, "readability": <0-100>, "roleAlignment": <0-100> },
         "summary": "..."
-      }},
-      "jobSuitability": {{
+      },
+      "jobSuitability": {
         "match": "<High | Medium | Low>",
         "percentage": <0-100>,
         "reasoning": "..."
-      }},
-      "careerSuggestions": {{
+      },
+      "careerSuggestions": {
         "recommendedRoles": ["<Role 1>", "<Role 2>", "<Role 3>"],
         "marketOutlook": "<Description of current demand and typical openings for these roles>",
         "topCompaniesToTarget": ["<Company 1>", "<Company 2>"]
-      }},
-      "resumePersona": {{
+      },
+      "resumePersona": {
         "tone": "<e.g. Leader, Doer, Academic, Creative>",
         "impression": "<short description of the vibe>"
-      }},
-      "salaryEstimation": {{
+      },
+      "salaryEstimation": {
         "range": "<e.g. $80k - $100k or ₹10L - ₹15L>",
         "currency": "<inferred from location>"
-      }},
-      "keywordAnalysis": {{
+      },
+      "keywordAnalysis": {
         "jobRoleInferred": "...",
         "matchedKeywords": ["..."],
         "missingImportantKeywords": ["..."],
         "niceToHaveKeywords": ["..."]
-      }},
+      },
       "strengths": ["..."],
       "weaknesses": ["..."]
-    }}
+    }
     
     Return ONLY valid JSON. Do not include any other text.
     """
-    return await generate_json(prompt)
 
-async def run_ats_optimizer(resume_text: str, job_description: str = None) -> dict:
-    prompt = f"""
+_ATS_OPTIMIZER_TAIL = """
     You are an ATS_OPTIMIZER_AGENT.
     Goal: Suggest improvements to increase ATS score.
     
-    Resume Text:
-    {resume_text}
-    
-    Job Description:
-    {job_description if job_description else "Not provided."}
-    
     Output must be a JSON object with the exact structure:
-    {{
+    {
       "overallStrategy": "...",
       "sectionLevelSuggestions": [
-        {{ "section": "...", "issue": "...", "suggestion": "...", "exampleRewrite": "..." }}
+        { "section": "...", "issue": "...", "suggestion": "...", "exampleRewrite": "..." }
       ],
-      "keywordSuggestions": {{
-        "addTheseKeywords": [ {{ "keyword": "...", "reason": "...", "whereToAdd": "..." }} ],
-        "removeOrReduceTheseKeywords": [ {{ "keyword": "...", "reason": "..." }} ]
-      }},
+      "keywordSuggestions": {
+        "addTheseKeywords": [ { "keyword": "...", "reason": "...", "whereToAdd": "..." } ],
+        "removeOrReduceTheseKeywords": [ { "keyword": "...", "reason": "..." } ]
+      },
       "skillGapLearningPath": [
-        {{ "skill": "<missing skill>", "learningTopics": ["<topic1>", "<topic2>"] }}
+        { "skill": "<missing skill>", "learningTopics": ["<topic1>", "<topic2>"] }
       ],
       "formattingAndStructureTips": ["..."],
-      "estimatedImprovedAtsScore": {{ "score": <0-100>, "assumptions": "..." }}
-    }}
+      "estimatedImprovedAtsScore": { "score": <0-100>, "assumptions": "..." }
+    }
     
     Return ONLY valid JSON.
     """
-    return await generate_json(prompt)
 
-async def run_interview_coach(resume_text: str, job_description: str = None) -> dict:
-    prompt = f"""
+_INTERVIEW_COACH_TAIL = """
     You are an INTERVIEW_COACH_AGENT.
     Goal: Generate 30 interview questions (10 Easy, 10 Medium, 10 Hard).
     
-    Resume Text:
-    {resume_text}
-    
-    Job Description:
-    {job_description if job_description else "Not provided."}
-    
     Output must be a JSON object with the exact structure:
-    {{
+    {
       "targetRole": "...",
-      "difficultyDistribution": {{ "easy": 10, "medium": 10, "hard": 10 }},
+      "difficultyDistribution": { "easy": 10, "medium": 10, "hard": 10 },
       "questions": [
-        {{ "id": "Q1", "difficulty": "Easy", "category": "...", "question": "...", "basedOn": {{ "resumeSection": "...", "keywords": ["..."] }}, "followUpHint": "..." }}
+        { "id": "Q1", "difficulty": "Easy", "category": "...", "question": "...", "basedOn": { "resumeSection": "...", "keywords": ["..."] }, "followUpHint": "..." }
       ]
-    }}
+    }
     
     Return ONLY valid JSON.
     """
-    return await generate_json(prompt)
 
-async def run_interview_answer_generator(resume_text: str, job_description: str, questions: list) -> dict:
-    questions_str = json.dumps(questions)
-    prompt = f"""
+_INTERVIEW_ANSWER_TMPL = """
     You are an INTERVIEW_PREP_EXPERT.
     Goal: Generate model answers for the provided interview questions, tailored to the candidate's resume.
     
-    Resume Text:
-    {resume_text}
-    
-    Job Description:
-    {job_description if job_description else "Not provided."}
-    
     Questions:
-    {questions_str}
+    {questions}
     
     Output must be a JSON object with the exact structure:
     {{
@@ -191,5 +302,25 @@ async def run_interview_answer_generator(resume_text: str, job_description: str,
     
     Return ONLY valid JSON.
     """
-    return await generate_json(prompt)
+
+@cached_agent
+async def run_ats_analyzer(resume_text: str, job_description: str = None) -> dict:
+    prompt = _prompt_prefix(resume_text, job_description) + _ATS_ANALYZER_TAIL
+    return await generate_json(prompt, validate_ats_analyzer)
+
+@cached_agent
+async def run_ats_optimizer(resume_text: str, job_description: str = None) -> dict:
+    prompt = _prompt_prefix(resume_text, job_description) + _ATS_OPTIMIZER_TAIL
+    return await generate_json(prompt, validate_ats_optimizer)
+
+@cached_agent
+async def run_interview_coach(resume_text: str, job_description: str = None) -> dict:
+    prompt = _prompt_prefix(resume_text, job_description) + _INTERVIEW_COACH_TAIL
+    return await generate_json(prompt, validate_interview_coach)
+
+async def run_interview_answer_generator(resume_text: str, job_description: str, questions: list) -> dict:
+    prompt = _prompt_prefix(resume_text, job_description) + _INTERVIEW_ANSWER_TMPL.format_map({
+        "questions": orjson.dumps(questions).decode(),
+    })
+    return await generate_json(prompt, validate_interview_answers)
 
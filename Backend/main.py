@@ -1,25 +1,93 @@
 import os
-import json
-from typing import Optional, List
-from fastapi import FastAPI, UploadFile, File, Form, HTTPException
+import sys
+import atexit
+import logging
+import logging.handlers
+import queue
+import orjson
+import asyncio
+from contextlib import asynccontextmanager
+from typing import Optional, List, BinaryIO
+from fastapi import FastAPI, UploadFile, File, Form, HTTPException, Request, Depends
 from fastapi.middleware.cors import CORSMiddleware
-from pydantic import BaseModel
+from fastapi.middleware.gzip import GZipMiddleware
+from fastapi.responses import JSONResponse, Response
+from starlette.datastructures import Headers
+import msgspec
 from dotenv import load_dotenv
 import uvicorn
-import io
 from pypdf import PdfReader
 
 # Load environment variables
 load_dotenv()
 
+# Handlers only enqueue records; a background listener thread does the actual writes
+_log_queue = queue.SimpleQueue()
+_log_listener = logging.handlers.QueueListener(_log_queue, logging.StreamHandler())
+logger = logging.getLogger("neuraresume")
+logger.setLevel(logging.INFO)
+logger.addHandler(logging.handlers.QueueHandler(_log_queue))
+logger.propagate = False
+_log_listener.start()
+atexit.register(_log_listener.stop)
+
 # Import agents (will be created in agents.py)
-from agents import run_ats_analyzer, run_ats_optimizer, run_interview_coach, run_interview_answer_generator, LLM_MODEL
+from agents import run_ats_analyzer, run_ats_optimizer, run_interview_coach, run_interview_answer_generator, compact_resume_text, load_tokenizer, LLM_MODEL
+
+
+logger.info("Loaded LLM Model: %s", LLM_MODEL)
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Runs once per worker (not in the reload supervisor); the fetch may hit the network
+    await asyncio.to_thread(load_tokenizer)
+    yield
+
+app = FastAPI(title="NeuraResume Backend", lifespan=lifespan)
+
+# Largest resume upload accepted by /analyze, in bytes
+MAX_PDF_BYTES = 5_000_000
+# Largest /analyze request body: the PDF plus room for the text fields and multipart framing
+MAX_ANALYZE_BODY_BYTES = MAX_PDF_BYTES + 1_000_000
+
+ANALYZE_BODY_TOO_LARGE = "Request body too large. Resume uploads and text must total under 6 MB."
 
+class LimitAnalyzeBodySize:
+    """ASGI middleware that caps the /analyze request body, counting bytes as they arrive."""
 
-print(f"Loaded LLM Model: {LLM_MODEL}")
+    def __init__(self, app, max_bytes: int):
+        self.app = app
+        self.max_bytes = max_bytes
 
-app = FastAPI(title="NeuraResume Backend")
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["path"] != "/analyze":
+            await self.app(scope, receive, send)
+            return
 
+        # Declared size: reject before reading anything
+        content_length = Headers(scope=scope).get("content-length")
+        if content_length and content_length.isdigit() and int(content_length) > self.max_bytes:
+            response = JSONResponse(status_code=413, content={"detail": ANALYZE_BODY_TOO_LARGE})
+            await response(scope, receive, send)
+            return
+
+        # Chunked or understated bodies: abort the read once the running total passes the cap.
+        # HTTPException propagates out of FastAPI's form parsing and is turned into the 413.
+        received = 0
+
+        async def limited_receive():
+            nonlocal received
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > self.max_bytes:
+                    raise HTTPException(status_code=413, detail=ANALYZE_BODY_TOO_LARGE)
+            return message
+
+        await self.app(scope, limited_receive, send)
+
+# Registered before CORS so the 413 still carries CORS headers
+app.add_middleware(LimitAnalyzeBodySize, max_bytes=MAX_ANALYZE_BODY_BYTES)
 
 # CORS Configuration
 app.add_middleware(
@@ -30,11 +98,23 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Compress the larger JSON responses (analyzer output is several KB of text)
+app.add_middleware(GZipMiddleware, minimum_size=1024, compresslevel=5)
+
+def orjson_response(content) -> Response:
+    """Serializes the agent results in one orjson pass, skipping jsonable_encoder."""
+    return Response(orjson.dumps(content), media_type="application/json")
+
+def pdf_to_text(pdf_file: BinaryIO) -> str:
+    """Extracts the text of every page in a PDF file object."""
+    reader = PdfReader(pdf_file)
+    return "\n".join(page.extract_text() or "" for page in reader.pages)
+
 @app.get("/")
 def read_root():
     return {"message": "NeuraResume API is running"}
 
-@app.post("/analyze")
+@app.post("/analyze", response_model=None)
 async def analyze_resume(
     resumeText: Optional[str] = Form(None),
     jobDescription: Optional[str] = Form(None),
@@ -47,29 +127,28 @@ async def analyze_resume(
     try:
         # Parse tasks JSON
         try:
-            tasks_dict = json.loads(tasks)
-            print(f"Received tasks: {tasks_dict}")
-        except json.JSONDecodeError:
-            print("Error decoding tasks JSON")
+            tasks_dict = orjson.loads(tasks)
+            logger.info("Received tasks: %s", tasks_dict)
+        except orjson.JSONDecodeError:
+            logger.warning("Error decoding tasks JSON")
             raise HTTPException(status_code=400, detail="Invalid JSON for tasks")
 
         final_resume_text = ""
 
         # Handle File Upload (PDF)
         if resumeFile:
-            print(f"Received file: {resumeFile.filename}, content_type: {resumeFile.content_type}")
+            logger.info("Received file: %s, content_type: %s", resumeFile.filename, resumeFile.content_type)
             if resumeFile.content_type == "application/pdf":
+                if (resumeFile.size or 0) > MAX_PDF_BYTES:
+                    raise HTTPException(status_code=413, detail="Upload too large. PDFs must be under 5 MB.")
                 try:
-                    contents = await resumeFile.read()
-                    pdf_stream = io.BytesIO(contents)
-                    reader = PdfReader(pdf_stream)
-                    text = ""
-                    for page in reader.pages:
-                        text += page.extract_text() + "\n"
-                    final_resume_text = text
-                    print(f"Extracted text length: {len(final_resume_text)}")
+                    # Parse straight from the spooled upload instead of copying it into memory
+                    await resumeFile.seek(0)
+                    # pypdf is synchronous and CPU-bound, keep it off the event loop
+                    final_resume_text = await asyncio.to_thread(pdf_to_text, resumeFile.file)
+                    logger.info("Extracted text length: %d", len(final_resume_text))
                 except Exception as e:
-                    print(f"Error reading PDF: {e}")
+                    logger.warning("Error reading PDF: %s", e)
                     raise HTTPException(status_code=400, detail=f"Error reading PDF: {str(e)}")
             else:
                 # Fallback for other files if needed, or error
@@ -78,66 +157,129 @@ async def analyze_resume(
         # Fallback to text input if no file or file failed (though we raised error above)
         if not final_resume_text and resumeText:
             final_resume_text = resumeText
-            print(f"Received resume text length: {len(final_resume_text)}")
+            logger.info("Received resume text length: %d", len(final_resume_text))
 
         if not final_resume_text.strip():
-             print("No resume text provided")
+             logger.warning("No resume text provided")
              raise HTTPException(status_code=400, detail="No resume text provided (either via file or text input).")
 
+        # Compact once so every agent shares the same (smaller) resume text; tokenizing is CPU-bound
+        final_resume_text = await asyncio.to_thread(compact_resume_text, final_resume_text)
+        logger.info("Compacted resume text length: %d", len(final_resume_text))
+
         results = {
             "atsAnalyzer": None,
             "atsOptimizer": None,
             "interviewCoach": None
         }
 
-        if tasks_dict.get("runAtsAnalyzer"):
-            print("Running ATS Analyzer...")
-            results["atsAnalyzer"] = await run_ats_analyzer(final_resume_text, jobDescription)
-            print("ATS Analyzer done.")
+        async def run_task(key: str, label: str, agent):
+            logger.info("Running %s...", label)
+            result = await agent(final_resume_text, jobDescription)
+            logger.info("%s done.", label)
+            return key, result
 
-        if tasks_dict.get("runAtsOptimizer"):
-            print("Running ATS Optimizer...")
-            results["atsOptimizer"] = await run_ats_optimizer(final_resume_text, jobDescription)
-            print("ATS Optimizer done.")
+        task_specs = [
+            ("runAtsAnalyzer", "atsAnalyzer", "ATS Analyzer", run_ats_analyzer),
+            ("runAtsOptimizer", "atsOptimizer", "ATS Optimizer", run_ats_optimizer),
+            ("runInterviewCoach", "interviewCoach", "Interview Coach", run_interview_coach),
+        ]
+        coros = [
+            run_task(key, label, agent)
+            for flag, key, label, agent in task_specs
+            if tasks_dict.get(flag)
+        ]
 
-        if tasks_dict.get("runInterviewCoach"):
-            print("Running Interview Coach...")
-            results["interviewCoach"] = await run_interview_coach(final_resume_text, jobDescription)
-            print("Interview Coach done.")
+        # Agents are independent LLM calls, so run them concurrently
+        outs = await asyncio.gather(*coros, return_exceptions=True)
+        for out in outs:
+            if isinstance(out, Exception):
+                raise out
+            key, result = out
+            results[key] = result
 
-        return results
+        return orjson_response(results)
 
     except HTTPException as he:
         raise he
     except Exception as e:
-        print(f"Internal Server Error: {e}")
+        logger.error("Internal Server Error: %s", e)
         raise HTTPException(status_code=500, detail=str(e))
 
-class GenerateAnswersRequest(BaseModel):
+# Number of questions sent to the answer generator per LLM call
+ANSWER_BATCH_SIZE = 8
+
+class GenerateAnswersRequest(msgspec.Struct):
     resumeText: str
-    jobDescription: Optional[str] = None
     questions: List[dict]
+    jobDescription: Optional[str] = None
+
+# The body is decoded by msgspec rather than FastAPI, so describe it in the OpenAPI docs by hand
+_, _answers_request_components = msgspec.json.schema_components([GenerateAnswersRequest])
+GENERATE_ANSWERS_OPENAPI = {
+    "requestBody": {
+        "required": True,
+        "content": {
+            "application/json": {"schema": _answers_request_components["GenerateAnswersRequest"]}
+        },
+    }
+}
 
-@app.post("/generate-answers")
-async def generate_answers(request: GenerateAnswersRequest):
+async def decode_generate_answers_request(request: Request) -> GenerateAnswersRequest:
+    """Decodes the request body straight into a GenerateAnswersRequest."""
+    try:
+        return msgspec.json.decode(await request.body(), type=GenerateAnswersRequest)
+    except (msgspec.DecodeError, msgspec.ValidationError) as e:
+        raise HTTPException(status_code=422, detail=str(e))
+
+@app.post("/generate-answers", response_model=None, openapi_extra=GENERATE_ANSWERS_OPENAPI)
+async def generate_answers(request: GenerateAnswersRequest = Depends(decode_generate_answers_request)):
     """
     Generate answers for the provided questions.
     """
     try:
-        print("Generating answers...")
+        logger.info("Generating answers...")
         # Extract just the question text and ID for the agent to save tokens
         simplified_questions = [{"id": q.get("id"), "question": q.get("question")} for q in request.questions]
         
-        result = await run_interview_answer_generator(
-            request.resumeText, 
-            request.jobDescription, 
-            simplified_questions
-        )
-        return result
+        resume_text = await asyncio.to_thread(compact_resume_text, request.resumeText)
+
+        # Answer in fixed-size batches so each completion stays well under max_tokens
+        batches = [
+            simplified_questions[i:i + ANSWER_BATCH_SIZE]
+            for i in range(0, len(simplified_questions), ANSWER_BATCH_SIZE)
+        ]
+        async def answer_batch(batch: list) -> list:
+            # generate_json already retries invalid output, so a failure here is final.
+            # A short batch would leave the guide incomplete and misnumbered.
+            part = await run_interview_answer_generator(resume_text, request.jobDescription, batch)
+            if not part or len(part["answers"]) != len(batch):
+                raise HTTPException(status_code=502, detail="Failed to generate answers for all questions.")
+            return part["answers"]
+
+        tasks = [asyncio.create_task(answer_batch(batch)) for batch in batches]
+        try:
+            parts = await asyncio.gather(*tasks)
+        except BaseException:
+            # Stop the remaining batches from spending tokens once one has failed
+            for task in tasks:
+                task.cancel()
+            raise
+        answers = [answer for part in parts for answer in part]
+        return orjson_response({"answers": answers})
+    except HTTPException as he:
+        raise he
     except Exception as e:
-        print(f"Error generating answers: {e}")
+        logger.error("Error generating answers: %s", e)
         raise HTTPException(status_code=500, detail=str(e))
 
 
 if __name__ == "__main__":
-    uvicorn.run("main:app", host="0.0.0.0", port=8000, reload=True)
+    # uvloop is not available on Windows, fall back to the stdlib loop there
+    loop = "asyncio" if sys.platform == "win32" else "uvloop"
+    if os.getenv("ENV") == "prod":
+        # One worker process per core; reload is a dev-only feature
+        workers = int(os.getenv("WORKERS", os.cpu_count() or 1))
+        uvicorn.run("main:app", host="0.0.0.0", port=8000, workers=workers, loop=loop, http="httptools")
+    else:
+        uvicorn.run("main:app", host="0.0.0.0", port=8000, reload=True, loop=loop, http="httptools")
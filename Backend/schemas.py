@@ -0,0 +1,79 @@
+import fastjsonschema
+
+# JSON schemas for the agent outputs. They only check the fields ResultsDashboard.jsx
+# dereferences (calls .map on, or reads off a nested object), so a response that
+# would crash the UI is rejected while unused or optional fields are left alone.
+
+_ARRAY = {"type": "array"}
+_STRING_ARRAY = {"type": "array", "items": {"type": "string"}}
+
+ATS_ANALYZER_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "careerSuggestions": {
+            "type": "object",
+            "required": ["recommendedRoles"],
+            "properties": {
+                "recommendedRoles": _STRING_ARRAY,
+                "topCompaniesToTarget": _STRING_ARRAY,
+            },
+        },
+        "strengths": _ARRAY,
+        "weaknesses": _ARRAY,
+    },
+}
+
+ATS_OPTIMIZER_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "sectionLevelSuggestions": {"type": "array", "items": {"type": "object"}},
+        "skillGapLearningPath": {
+            "type": "array",
+            "items": {
+                "type": "object",
+                "required": ["learningTopics"],
+                "properties": {"learningTopics": _STRING_ARRAY},
+            },
+        },
+    },
+}
+
+INTERVIEW_COACH_SCHEMA = {
+    "type": "object",
+    "required": ["questions"],
+    "properties": {
+        "questions": {
+            "type": "array",
+            "items": {
+                "type": "object",
+                # id is sent back to /generate-answers alongside the question text
+                "required": ["id", "question"],
+                "properties": {"question": {"type": "string"}},
+            },
+        },
+    },
+}
+
+INTERVIEW_ANSWER_SCHEMA = {
+    "type": "object",
+    "required": ["answers"],
+    "properties": {
+        "answers": {
+            "type": "array",
+            "items": {
+                "type": "object",
+                "required": ["question", "answer"],
+                "properties": {
+                    "question": {"type": "string"},
+                    "answer": {"type": "string"},
+                },
+            },
+        },
+    },
+}
+
+# Compiled once at import
+validate_ats_analyzer = fastjsonschema.compile(ATS_ANALYZER_SCHEMA)
+validate_ats_optimizer = fastjsonschema.compile(ATS_OPTIMIZER_SCHEMA)
+validate_interview_coach = fastjsonschema.compile(INTERVIEW_COACH_SCHEMA)
+validate_interview_answers = fastjsonschema.compile(INTERVIEW_ANSWER_SCHEMA)